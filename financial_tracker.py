@@ -1,7 +1,12 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from contextlib import contextmanager
 import sqlite3
+import math
 import os
-import json
+import queue
+import threading
+import anyio
+import orjson
 from mcp.server.fastmcp import FastMCP
 
 # Initialize FastMCP server
@@ -10,21 +15,65 @@ mcp = FastMCP("financial-tracker")
 # Database setup
 DB_FILE = "finance_tracker.db"
 
-def initialize_db():
-    """Initialize the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Create transactions table if it doesn't exist
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS transactions (
+# Number of rows fetched per batch when exporting
+EXPORT_BATCH_SIZE = 1000
+
+# Upper bound on the number of rows list_transactions returns in one call
+MAX_LIST_LIMIT = 10000
+
+# Number of read-only connections shared by the read tools
+READER_POOL_SIZE = 4
+
+# SQL used by the tools. Keeping the text identical across calls lets the
+# connection's statement cache reuse the prepared statements.
+_SQL_INSERT_TX = "INSERT INTO transactions (amount, category, description) VALUES (?, ?, ?)"
+_SQL_INSERT_TX_RETURNING = _SQL_INSERT_TX + " RETURNING id, timestamp"
+_SQL_CATEGORY_TOTALS = "SELECT category, total FROM category_totals WHERE count > 0 ORDER BY category"
+_SQL_LIST_ALL = "SELECT printf('$%.2f (%s) - %s', amount, category, description) FROM transactions ORDER BY timestamp DESC LIMIT ?"
+_SQL_LIST_CAT = "SELECT printf('$%.2f (%s) - %s', amount, category, description) FROM transactions WHERE category = ? ORDER BY timestamp DESC LIMIT ?"
+_SQL_SELECT_CATEGORIES = "SELECT name FROM categories"
+_SQL_INSERT_CATEGORY = "INSERT OR IGNORE INTO categories (name) VALUES (?)"
+_SQL_EXPORT = "SELECT * FROM transactions ORDER BY timestamp DESC"
+
+# RETURNING is available from SQLite 3.35
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Category names cached for membership checks; replaced or extended under _WRITE_LOCK
+_CATEGORIES: Set[str] = set()
+_WRITE_LOCK = threading.Lock()
+
+def _connect(read_only: bool = False) -> sqlite3.Connection:
+    """Open a connection to the database with the per-connection pragmas applied."""
+    database, uri = (f"file:{DB_FILE}?mode=ro", True) if read_only else (DB_FILE, False)
+    conn = sqlite3.connect(database, uri=uri, isolation_level=None, check_same_thread=False, cached_statements=200)
+    # These pragmas are not persisted in the database file, so every connection sets them
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    # Readers get a smaller page cache since several of them are kept open
+    conn.execute("PRAGMA cache_size=-16384" if read_only else "PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+# Transactions table schema; the category must name a row in the categories table
+_TRANSACTIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {table} (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         amount REAL NOT NULL,
-        category TEXT NOT NULL,
+        category TEXT NOT NULL REFERENCES categories (name) ON UPDATE CASCADE,
         description TEXT NOT NULL,
         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
     )
-    ''')
+    '''
+
+def initialize_db():
+    """Initialize the SQLite database."""
+    conn = _connect()
+    cursor = conn.cursor()
+    
+    # WAL lets readers proceed alongside a writer and is persisted in the database file
+    cursor.execute("PRAGMA journal_mode=WAL")
     
     # Create categories table if it doesn't exist
     cursor.execute('''
@@ -39,18 +88,206 @@ def initialize_db():
     for category in default_categories:
         cursor.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (category,))
     
+    # Create transactions table if it doesn't exist
+    cursor.execute(_TRANSACTIONS_SCHEMA.format(table="transactions"))
+    _migrate_category_foreign_key(cursor)
+    
+    # Indexes for the timestamp-ordered listings. Balances come from category_totals,
+    # so the old (category, amount) index would only slow every insert down.
+    cursor.execute("DROP INDEX IF EXISTS idx_tx_cat_amt")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tx_ts ON transactions (timestamp DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tx_cat_ts ON transactions (category, timestamp DESC)")
+    
+    _create_category_totals(cursor)
+    
     conn.commit()
+    
+    _refresh_statistics(cursor)
+    _refresh_categories(cursor)
     conn.close()
 
+def _refresh_statistics(cursor: sqlite3.Cursor):
+    """Refresh the planner statistics so the indexes keep being picked up as the tables grow."""
+    # analysis_limit makes ANALYZE sample a bounded number of rows per index, so this
+    # stays cheap on every startup however large the tables get
+    cursor.execute("PRAGMA analysis_limit=400")
+    cursor.execute("ANALYZE")
+
+def _create_category_totals(cursor: sqlite3.Cursor):
+    """Create the per-category running totals kept up to date by triggers on transactions."""
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'category_totals'")
+        exists = cursor.fetchone() is not None
+        
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_totals (
+            category TEXT PRIMARY KEY,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''')
+        
+        # Backfill from transactions recorded before the table existed
+        if not exists:
+            cursor.execute(
+                "INSERT INTO category_totals (category, total, count) "
+                "SELECT category, SUM(amount), COUNT(*) FROM transactions GROUP BY category"
+            )
+        
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_tx_ins AFTER INSERT ON transactions BEGIN
+            INSERT INTO category_totals (category, total, count) VALUES (NEW.category, NEW.amount, 1)
+            ON CONFLICT (category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_tx_del AFTER DELETE ON transactions BEGIN
+            UPDATE category_totals SET total = total - OLD.amount, count = count - 1
+            WHERE category = OLD.category;
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_tx_upd AFTER UPDATE OF amount, category ON transactions BEGIN
+            UPDATE category_totals SET total = total - OLD.amount, count = count - 1
+            WHERE category = OLD.category;
+            INSERT INTO category_totals (category, total, count) VALUES (NEW.category, NEW.amount, 1)
+            ON CONFLICT (category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+        ''')
+        cursor.execute("COMMIT")
+    except sqlite3.Error:
+        cursor.execute("ROLLBACK")
+        raise
+
+def _migrate_category_foreign_key(cursor: sqlite3.Cursor):
+    """Rebuild a transactions table created before the category foreign key existed."""
+    cursor.execute("PRAGMA foreign_key_list(transactions)")
+    if cursor.fetchall():
+        return
+    
+    cursor.execute("BEGIN")
+    try:
+        # Keep categories used by existing transactions valid under the new constraint
+        cursor.execute("INSERT OR IGNORE INTO categories (name) SELECT DISTINCT category FROM transactions")
+        cursor.execute(_TRANSACTIONS_SCHEMA.format(table="transactions_new"))
+        cursor.execute(
+            "INSERT INTO transactions_new (id, amount, category, description, timestamp) "
+            "SELECT id, amount, category, description, timestamp FROM transactions"
+        )
+        cursor.execute("DROP TABLE transactions")
+        cursor.execute("ALTER TABLE transactions_new RENAME TO transactions")
+        cursor.execute("COMMIT")
+    except sqlite3.Error:
+        cursor.execute("ROLLBACK")
+        raise
+
+def _refresh_categories(cursor: sqlite3.Cursor):
+    """Reload the cached category set from the database."""
+    global _CATEGORIES
+    cursor.execute(_SQL_SELECT_CATEGORIES)
+    names = {row[0] for row in cursor.fetchall()}
+    with _WRITE_LOCK:
+        _CATEGORIES = names
+
+@contextmanager
+def _reader() -> Iterator[sqlite3.Connection]:
+    """Borrow a read-only connection from the pool for the duration of the block."""
+    conn = _READERS.get()
+    try:
+        yield conn
+    finally:
+        _READERS.put(conn)
+
 def get_categories() -> List[str]:
     """Get all available transaction categories."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM categories")
-    categories = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with _reader() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_SQL_SELECT_CATEGORIES)
+        categories = [row[0] for row in cursor.fetchall()]
     return categories
 
+# The helpers below do the blocking database work for the tools. The tools run
+# them in worker threads so concurrent calls are not serialized on the event loop.
+
+def _insert_transaction(amount: float, category: str, description: str) -> Tuple[int, Optional[str]]:
+    """Insert one transaction and return its id and timestamp."""
+    with _WRITE_LOCK:
+        cursor = _WRITER.cursor()
+        if _HAS_RETURNING:
+            cursor.execute(_SQL_INSERT_TX_RETURNING, (amount, category, description))
+            return cursor.fetchone()
+        cursor.execute(_SQL_INSERT_TX, (amount, category, description))
+        return cursor.lastrowid, None
+
+def _insert_transactions(rows: List[Tuple[float, str, str]]):
+    """Insert validated transaction rows in a single database transaction."""
+    with _WRITE_LOCK, _WRITER:
+        cursor = _WRITER.cursor()
+        cursor.execute("BEGIN")
+        cursor.executemany(_SQL_INSERT_TX, rows)
+
+def _read_category_totals() -> Dict[str, float]:
+    """Read the trigger-maintained balance of every category with transactions."""
+    with _reader() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_SQL_CATEGORY_TOTALS)
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+def _read_transaction_lines(category: Optional[str], limit: int) -> str:
+    """Return the most recent transactions as formatted lines."""
+    # Each row is formatted by SQLite's printf, so Python only joins the lines
+    with _reader() as conn:
+        cursor = conn.cursor()
+        if category:
+            cursor.execute(_SQL_LIST_CAT, (category, limit))
+        else:
+            cursor.execute(_SQL_LIST_ALL, (limit,))
+        return "\n".join(row[0] for row in cursor)
+
+def _insert_category(name: str) -> bool:
+    """Insert a category, returning False if it already exists."""
+    # A duplicate name is ignored rather than raised, and reported through rowcount
+    with _WRITE_LOCK:
+        cursor = _WRITER.cursor()
+        cursor.execute(_SQL_INSERT_CATEGORY, (name,))
+        if cursor.rowcount != 1:
+            return False
+        _CATEGORIES.add(name)
+        return True
+
+def _write_export(export_file: str):
+    """Stream every transaction into export_file as a JSON array."""
+    # Rows are written in batches rather than loading the whole table
+    with _reader() as conn, open(export_file, "wb") as f:
+        cursor = conn.cursor()
+        cursor.execute(_SQL_EXPORT)
+        columns = [d[0] for d in cursor.description]
+        
+        f.write(b"[")
+        separator = b"\n"
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                f.write(separator)
+                f.write(orjson.dumps(dict(zip(columns, row))))
+                separator = b",\n"
+        f.write(b"\n]")
+
+def _is_foreign_key_error(error: sqlite3.IntegrityError) -> bool:
+    """Check whether an IntegrityError came from a foreign key constraint."""
+    # sqlite_errorname is only available from Python 3.11; fall back to the message
+    errorname = getattr(error, "sqlite_errorname", None)
+    if errorname is not None:
+        return errorname == "SQLITE_CONSTRAINT_FOREIGNKEY"
+    return "FOREIGN KEY constraint failed" in str(error)
+
+async def _category_names() -> str:
+    """Get the available categories as a comma-separated string."""
+    return ", ".join(await anyio.to_thread.run_sync(get_categories))
+
 @mcp.tool()
 async def add_transaction(amount: float, category: str, description: str) -> str:
     """Add a new financial transaction.
@@ -60,81 +297,105 @@ async def add_transaction(amount: float, category: str, description: str) -> str
         category: Transaction category (e.g., "Food", "Transportation")
         description: Description of the transaction
     """
-    categories = get_categories()
-    if category not in categories:
-        return f"Invalid category. Please use one of: {', '.join(categories)}"
+    # SQLite stores NaN as NULL, which would otherwise surface as a NOT NULL failure
+    if not math.isfinite(amount):
+        return "Invalid amount. Please use a finite number."
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO transactions (amount, category, description) VALUES (?, ?, ?)",
-        (amount, category, description)
-    )
-    conn.commit()
-    conn.close()
+    # The category foreign key rejects unknown categories, so no lookup is needed first
+    try:
+        transaction_id, timestamp = await anyio.to_thread.run_sync(
+            _insert_transaction, amount, category, description
+        )
+    except sqlite3.IntegrityError as e:
+        if not _is_foreign_key_error(e):
+            raise
+        return f"Invalid category. Please use one of: {await _category_names()}"
     
-    return f"Transaction added: {amount} ({category}) - {description}"
+    result = f"Transaction added: {amount} ({category}) - {description} [id {transaction_id}"
+    if timestamp:
+        result += f", {timestamp}"
+    return result + "]"
 
 @mcp.tool()
-async def get_balance() -> str:
-    """Get current balance and summary of transactions."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+async def add_transactions(items: List[Dict[str, Any]]) -> str:
+    """Add several financial transactions at once.
     
-    # Get total balance
-    cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM transactions")
-    total = cursor.fetchone()[0]
+    Args:
+        items: Transactions to add, each with "amount", "category" and "description" keys
+    """
+    rows = []
+    skipped = []
+    for item in items:
+        # Anything that would fail at insert time is skipped here so the batch cannot roll back
+        try:
+            if isinstance(item["amount"], bool):
+                raise TypeError("amount must be a number")
+            amount = float(item["amount"])
+            category = item["category"]
+            description = item["description"]
+        except (KeyError, TypeError, ValueError, OverflowError):
+            skipped.append(str(item))
+            continue
+        if (
+            not math.isfinite(amount)
+            or not isinstance(category, str)
+            or not isinstance(description, str)
+            or category not in _CATEGORIES
+        ):
+            skipped.append(str(item))
+            continue
+        rows.append((amount, category, description))
     
-    # Get breakdown by category
-    cursor.execute("SELECT category, SUM(amount) FROM transactions GROUP BY category")
-    by_category = {row[0]: row[1] for row in cursor.fetchall()}
+    # Insert every valid row in one transaction instead of committing per row
+    if rows:
+        await anyio.to_thread.run_sync(_insert_transactions, rows)
     
-    conn.close()
+    result = [f"Transactions added: {len(rows)}"]
+    if skipped:
+        result.append(
+            f"Skipped {len(skipped)} invalid transaction(s). Amounts must be finite numbers, "
+            f"descriptions text and categories one of: {await _category_names()}"
+        )
+        result.extend(skipped)
+    
+    return "\n".join(result)
+
+@mcp.tool()
+async def get_balance() -> str:
+    """Get current balance and summary of transactions."""
+    # Read the trigger-maintained totals instead of scanning transactions
+    by_category = await anyio.to_thread.run_sync(_read_category_totals)
+    total = sum(by_category.values())
     
     if not by_category:
         return "No transactions recorded yet."
     
-    summary = ["Current balance: ${:.2f}".format(total)]
-    summary.append("\nBreakdown by category:")
-    for cat, amount in by_category.items():
-        summary.append(f"{cat}: ${amount:.2f}")
+    summary = ["Current balance: $%.2f" % total, "\nBreakdown by category:"]
+    summary.extend(map("%s: $%.2f".__mod__, by_category.items()))
     
     return "\n".join(summary)
 
 @mcp.tool()
-async def list_transactions(category: str = None) -> str:
-    """List all transactions, optionally filtered by category.
+async def list_transactions(category: str = None, limit: int = 500) -> str:
+    """List the most recent transactions, optionally filtered by category.
     
     Args:
         category: Optional category to filter transactions
+        limit: Maximum number of transactions to return (default 500, capped at 10000)
     """
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    if limit < 1:
+        return "Limit must be at least 1."
+    limit = min(limit, MAX_LIST_LIMIT)
     
-    if category:
-        categories = get_categories()
-        if category not in categories:
-            return f"Invalid category. Please use one of: {', '.join(categories)}"
-        
-        cursor.execute(
-            "SELECT amount, category, description FROM transactions WHERE category = ? ORDER BY timestamp DESC",
-            (category,)
-        )
-    else:
-        cursor.execute("SELECT amount, category, description FROM transactions ORDER BY timestamp DESC")
+    if category and category not in _CATEGORIES:
+        return f"Invalid category. Please use one of: {await _category_names()}"
     
-    transactions = cursor.fetchall()
-    conn.close()
+    result = await anyio.to_thread.run_sync(_read_transaction_lines, category, limit)
     
-    if not transactions:
+    if not result:
         return "No transactions found." if category else "No transactions recorded yet."
     
-    result = []
-    for t in transactions:
-        amount, cat, desc = t
-        result.append(f"${amount:.2f} ({cat}) - {desc}")
-    
-    return "\n".join(result)
+    return result
 
 @mcp.tool()
 async def add_category(name: str) -> str:
@@ -143,20 +404,14 @@ async def add_category(name: str) -> str:
     Args:
         name: The name of the new category
     """
-    if not name or len(name.strip()) == 0:
+    name = name.strip() if name else ""
+    if not name:
         return "Category name cannot be empty."
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute("INSERT INTO categories (name) VALUES (?)", (name,))
-        conn.commit()
-        conn.close()
-        return f"Category '{name}' added successfully."
-    except sqlite3.IntegrityError:
-        conn.close()
+    if not await anyio.to_thread.run_sync(_insert_category, name):
         return f"Category '{name}' already exists."
+    
+    return f"Category '{name}' added successfully."
 
 @mcp.tool()
 async def export_data(format: str = "json") -> str:
@@ -168,24 +423,20 @@ async def export_data(format: str = "json") -> str:
     if format.lower() != "json":
         return "Only JSON format is currently supported."
     
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM transactions ORDER BY timestamp DESC")
-    transactions = [dict(row) for row in cursor.fetchall()]
-    
-    conn.close()
-    
     export_file = "transactions_export.json"
-    with open(export_file, "w") as f:
-        json.dump(transactions, f, indent=2)
+    await anyio.to_thread.run_sync(_write_export, export_file)
     
     return f"Data exported to {export_file}"
 
+# Initialize the database and open the connections shared by all tool calls.
+# Tools do their database work in worker threads, so writes are serialized on
+# a single connection while reads run concurrently on a pool of read-only ones.
+initialize_db()
+_WRITER = _connect()
+_READERS = queue.Queue(maxsize=READER_POOL_SIZE)
+for _ in range(READER_POOL_SIZE):
+    _READERS.put(_connect(read_only=True))
+
 if __name__ == "__main__":
-    # Initialize the database
-    initialize_db()
-    
     # Initialize and run the server
     mcp.run(transport='stdio')
\ No newline at end of file